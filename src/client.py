@@ -1,11 +1,21 @@
+import functools
+import gzip
+import io
 import logging
 import os
+import shutil
 import socket
+import threading
 import zipfile
-from typing import Callable, Optional
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Union
 
 try:
     from .shared import (
+        IO_BUF,
+        SOCK_BUF,
         ErrorDuringDownload,
         ErrorDuringUpload,
         FileNotFound,
@@ -13,40 +23,295 @@ try:
     )
 except ImportError:  # pragma: no cover - script/CLI execution
     from shared import (  # type: ignore
+        IO_BUF,
+        SOCK_BUF,
         ErrorDuringDownload,
         ErrorDuringUpload,
         FileNotFound,
         PeerDisconnected,
     )
 
+try:
+    import pgzip
+except ImportError:  # pragma: no cover - optional dependency
+    pgzip = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+COMPRESS_LEVEL = 1
+# Files at least this large are gzipped on all cores when pgzip is installed.
+PARALLEL_GZIP_MIN = 16 * IO_BUF
+PARALLEL_GZIP_BLOCK = 4 * IO_BUF
+ZSTD_LEVEL = 3
+CODECS = ("deflate", "zstd")
+COMPRESSED_SUFFIXES = (".zip", ".gz", ".zst")
+# Keepalive timers: probe after this many idle seconds, every
+# KEEPALIVE_INTERVAL seconds, and drop the connection after KEEPALIVE_PROBES
+# unanswered probes. The OS defaults wait two hours before the first probe.
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_PROBES = 3
+# Linux calls the idle timer TCP_KEEPIDLE, macOS TCP_KEEPALIVE.
+_TCP_KEEPIDLE = getattr(socket, "TCP_KEEPIDLE", getattr(socket, "TCP_KEEPALIVE", None))
+# Uncompressed shares go up this many files per BATCH LOAD command.
+SHARE_BATCH_FILES = 256
+# share_directory keeps this many connections open for the whole share, and
+# the server holds a worker thread per open connection, so its pool must be
+# larger than the number of sharing clients or the extra connections starve.
+SHARE_CONNECTIONS = 4
+# Seconds a share connection may wait on the server before giving up, so a
+# starved connection fails the share instead of hanging it.
+SHARE_TIMEOUT = 30.0
+
+
+def _enable_keepalive(sock: socket.socket) -> None:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (
+        (_TCP_KEEPIDLE, KEEPALIVE_IDLE),
+        (getattr(socket, "TCP_KEEPINTVL", None), KEEPALIVE_INTERVAL),
+        (getattr(socket, "TCP_KEEPCNT", None), KEEPALIVE_PROBES),
+    ):
+        if option is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+
+@functools.lru_cache(maxsize=None)
+def _deflate_backend() -> ModuleType:
+    codec = os.environ.get("FILEX_CODEC", "auto").lower()
+    if codec in ("auto", "isal"):
+        try:
+            from isal import isal_zlib
+
+            return isal_zlib
+        except ImportError:
+            if codec == "isal":
+                logging.warning("FILEX_CODEC=isal but isal is missing; using zlib.")
+    elif codec != "zlib":
+        logging.warning(f"Unknown FILEX_CODEC {codec!r}; using zlib.")
+    return zlib
+
+
+def _use_parallel_gzip(size: int) -> bool:
+    return pgzip is not None and size >= PARALLEL_GZIP_MIN
+
+
+def _open_parallel_gzip(target, fileobj: Optional[BinaryIO] = None):
+    return pgzip.PgzipFile(
+        target,
+        "wb",
+        compresslevel=COMPRESS_LEVEL,
+        fileobj=fileobj,
+        thread=os.cpu_count(),
+        blocksize=PARALLEL_GZIP_BLOCK,
+    )
+
+
+def _copy_with_progress(
+    src: BinaryIO, dest, progress_cb: Optional[Callable[[int], None]]
+) -> None:
+    while True:
+        chunk = src.read(IO_BUF)
+        if not chunk:
+            break
+        dest.write(chunk)
+        if progress_cb:
+            progress_cb(len(chunk))
+
+
+def _zip_stream(
+    src: BinaryIO,
+    dest: Union[str, BinaryIO],
+    arcname: str,
+    size: int,
+    progress_cb: Optional[Callable[[int], None]] = None,
+) -> None:
+    # One deflate path for archives on disk, in memory and on the socket;
+    # zipfile writes data descriptors when dest is not seekable.
+    with _ZipFile(dest, "w", zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+        force_zip64 = size * 1.05 > zipfile.ZIP64_LIMIT
+        with zf.open(arcname, "w", force_zip64=force_zip64) as member:
+            _copy_with_progress(src, member, progress_cb)
+
+
+def _walk_files(directory: str) -> Iterator[str]:
+    # scandir reports the entry type from the directory listing itself, so
+    # telling files from subdirectories costs no extra stat calls.
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path
+
+
+class _ZipFile(zipfile.ZipFile):
+    # zipfile is hard-wired to stdlib zlib. The backend selected through
+    # FILEX_CODEC is zlib-compatible, so swap it into each deflated member
+    # stream before any data flows through it.
+    def open(self, name, mode="r", pwd=None, *, force_zip64=False):
+        stream = super().open(name, mode, pwd, force_zip64=force_zip64)
+        backend = _deflate_backend()
+        if backend is zlib:
+            return stream
+        # These are CPython internals; if a release renames them, keep the
+        # stdlib stream rather than fail.
+        if mode == "w":
+            zinfo = getattr(stream, "_zinfo", None)
+            deflated = getattr(zinfo, "compress_type", None) == zipfile.ZIP_DEFLATED
+            if deflated and hasattr(stream, "_compressor"):
+                level = self.compresslevel
+                if level is None:
+                    level = backend.Z_DEFAULT_COMPRESSION
+                stream._compressor = backend.compressobj(level, zlib.DEFLATED, -15)
+        elif getattr(
+            stream, "_compress_type", None
+        ) == zipfile.ZIP_DEFLATED and hasattr(stream, "_decompressor"):
+            stream._decompressor = backend.decompressobj(-15)
+        return stream
+
+
+class _ChunkedWriter:
+    # Frames a compressed stream for LOAD as "<n>\n" + n bytes chunks and
+    # ends it with "0\n". Writes are gathered into IO_BUF-sized frames so
+    # the compressors' many small writes don't each cost a header.
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if len(self._buffer) >= IO_BUF:
+            self._send_frame()
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if self._buffer:
+            self._send_frame()
+        self._sock.sendall(b"0\n")
+
+    def _send_frame(self) -> None:
+        self._sock.sendall(b"%d\n" % len(self._buffer) + self._buffer)
+        self._buffer.clear()
+
 
 class FileClient:
-    def __init__(self, host: str = "0.0.0.0", port: int = 5050) -> None:
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 5050,
+        keepalive: bool = False,
+        timeout: Optional[float] = None,
+    ) -> None:
         self.host: str = host
         self.port: int = port
+        # Per-operation socket timeout for connect, send and receive.
+        self.timeout: Optional[float] = timeout
+        # For connections held open across many commands: probes an idle
+        # connection after KEEPALIVE_IDLE seconds so a peer that vanished is
+        # noticed within about a minute and a half.
+        self.keepalive: bool = keepalive
         self.client_socket: Optional[socket.socket] = None
+        self._reader: Optional[BinaryIO] = None
+        self._buffer: Optional[memoryview] = None
 
     def compress_file(self, path: str) -> str:
+        if _use_parallel_gzip(os.path.getsize(path)):
+            gz_path: str = f"{path}.gz"
+            with open(path, "rb") as src, _open_parallel_gzip(gz_path) as dest:
+                shutil.copyfileobj(src, dest, length=IO_BUF)
+            return gz_path
         zip_path: str = f"{path}.zip"
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            zf.write(path, arcname=os.path.basename(path))
+        with open(path, "rb") as src:
+            size = os.fstat(src.fileno()).st_size
+            _zip_stream(src, zip_path, os.path.basename(path), size)
         return zip_path
 
+    def compress_stream(self, data: bytes, arcname: str) -> bytes:
+        dest = io.BytesIO()
+        _zip_stream(io.BytesIO(data), dest, arcname, len(data))
+        return dest.getvalue()
+
+    def decompress_stream(self, zip_bytes: bytes) -> Dict[str, bytes]:
+        with _ZipFile(io.BytesIO(zip_bytes), "r") as zf:
+            return {name: zf.read(name) for name in zf.namelist()}
+
     def decompress_file(self, zip_path: str, output_dir: str = ".") -> None:
-        with zipfile.ZipFile(zip_path, "r") as zf:
+        if zip_path.endswith(".gz"):
+            # pgzip reads its own block index in parallel and plain gzip
+            # streams sequentially.
+            opener = pgzip.open if pgzip is not None else gzip.open
+            target = os.path.join(output_dir, os.path.basename(zip_path)[:-3])
+            with opener(zip_path, "rb") as src, open(target, "wb") as dest:
+                shutil.copyfileobj(src, dest, length=IO_BUF)
+            return
+        if zip_path.endswith(".zst"):
+            if zstandard is None:
+                raise ErrorDuringDownload("zstandard is required for .zst files")
+            target = os.path.join(output_dir, os.path.basename(zip_path)[:-4])
+            with open(zip_path, "rb") as src, open(target, "wb") as dest:
+                zstandard.ZstdDecompressor().copy_stream(
+                    src, dest, read_size=IO_BUF, write_size=IO_BUF
+                )
+            return
+        with _ZipFile(zip_path, "r") as zf:
             zf.extractall(output_dir)
 
     def connect(self) -> None:
         try:
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.client_socket.settimeout(self.timeout)
+            # Buffer sizes must be set before connect() to affect window scaling.
+            self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF)
+            self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF)
             self.client_socket.connect((self.host, self.port))
+            # Commands are small request/response exchanges; don't let Nagle
+            # hold them back on a reused connection.
+            self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.keepalive:
+                _enable_keepalive(self.client_socket)
+            # Responses are read through one buffered reader per connection so
+            # bytes that arrive behind a header are never stranded.
+            self._reader = self.client_socket.makefile("rb", buffering=IO_BUF)
             logging.info(f"Connected to server at {self.host}:{self.port}")
         except ConnectionRefusedError:
             logging.error("Server not running or refused connection.")
         except Exception as e:
             logging.error(f"Unexpected error: {e}")
 
+    def _recv_line(self) -> str:
+        line = self._reader.readline()
+        if not line:
+            raise PeerDisconnected("Connection closed by server")
+        return line.decode().strip()
+
+    def _recv_listing(self) -> str:
+        # GET FILES replies with one name per line and ends with a blank line.
+        names = []
+        while True:
+            line = self._recv_line()
+            if not line:
+                return "\n".join(names)
+            names.append(line)
+
+    def _recv_buffer(self) -> memoryview:
+        # Allocated once per client and reused by every download.
+        if self._buffer is None:
+            self._buffer = memoryview(bytearray(IO_BUF))
+        return self._buffer
+
     def disconnect(self) -> None:
+        if self._reader:
+            self._reader.close()
+            self._reader = None
         if self.client_socket:
             self.client_socket.close()
             logging.info("Disconnected.")
@@ -56,6 +321,7 @@ class FileClient:
         file_name: str,
         compress: bool = False,
         progress_cb: Optional[Callable[[int], None]] = None,
+        codec: str = "deflate",
     ) -> None:
         if not self.client_socket:
             logging.error("Not connected to server.")
@@ -65,50 +331,148 @@ class FileClient:
             logging.error(f"File {file_name} not found.")
             raise FileNotFound(f"File {file_name} not found.")
 
-        if compress:
-            file_to_send = self.compress_file(file_name)
-            label = os.path.basename(file_to_send)
-        else:
-            file_to_send = file_name
-            label = os.path.basename(file_name)
+        if codec not in CODECS:
+            raise ErrorDuringUpload(f"Unknown codec {codec!r}")
+        if compress and codec == "zstd" and zstandard is None:
+            raise ErrorDuringUpload("zstandard is required for --codec zstd")
+
+        if not compress:
+            # The size is known up front, so raw files go up as a one-file
+            # batch and skip LOAD's chunk framing.
+            self.upload_batch([file_name], progress_cb)
+            return
+
+        # zstd is a transport encoding the server undoes on receipt, so the
+        # label stays the plain file name; deflate uploads are stored as
+        # archives.
+        zstd = codec == "zstd"
+        parallel = not zstd and _use_parallel_gzip(os.path.getsize(file_name))
+        label = os.path.basename(file_name)
+        if parallel:
+            label = f"{label}.gz"
+        elif not zstd:
+            label = f"{label}.zip"
 
         try:
-            command = f"LOAD {label} {'COMPRESSED' if compress else ''}\n"
+            command = f"LOAD {label} COMPRESSED {codec.upper()}\n"
             self.client_socket.sendall(command.encode())
-            resp = self.client_socket.recv(1024).decode().strip()
+            resp = self._recv_line()
             if resp != "READY":
                 logging.error(f"Server not ready for upload: {resp}")
-                return
-
-            with open(file_to_send, "rb") as f:
-                while True:
-                    chunk = f.read(4096)
-                    if not chunk:
-                        break
-                    self.client_socket.sendall(chunk)
-                    if progress_cb:
-                        progress_cb(len(chunk))
+                raise ErrorDuringUpload(resp)
 
-            self.client_socket.sendall(b"<END>\n")
+            dest = _ChunkedWriter(self.client_socket)
+            with open(file_name, "rb") as f:
+                if zstd:
+                    self._send_zstd(f, dest, progress_cb)
+                elif parallel:
+                    self._send_gzip(f, dest, progress_cb)
+                else:
+                    self._send_zip(f, dest, progress_cb)
+            dest.close()
+
+            status = self._recv_line()
+            if status != "OK":
+                raise ErrorDuringUpload(status)
             logging.info(f"Upload of {file_name} complete.")
 
-            if compress:
-                try:
-                    os.remove(file_to_send)
-                    logging.info(f"Removed temporary zip file: {file_to_send}")
-                except OSError:
-                    pass
+        except Exception as e:
+            logging.error(f"Error during upload: {e}")
+            raise ErrorDuringUpload(str(e))
+
+    def upload_batch(
+        self,
+        file_names: List[str],
+        progress_cb: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        if not self.client_socket:
+            logging.error("Not connected to server.")
+            return
+
+        try:
+            manifest = [f"BATCH LOAD {len(file_names)}\n"]
+            sizes = []
+            for file_name in file_names:
+                size = os.path.getsize(file_name)
+                sizes.append(size)
+                manifest.append(f"{os.path.basename(file_name)}\t{size}\n")
+            self.client_socket.sendall("".join(manifest).encode())
+            resp = self._recv_line()
+            if resp != "READY":
+                logging.error(f"Server not ready for upload: {resp}")
+                raise ErrorDuringUpload(resp)
+
+            for file_name, size in zip(file_names, sizes):
+                with open(file_name, "rb") as f:
+                    sent = self._send_raw(f, progress_cb, size)
+                if sent != size:
+                    raise ErrorDuringUpload(f"{file_name} changed during upload")
+
+            status = self._recv_line()
+            if status != "OK":
+                raise ErrorDuringUpload(status)
+            logging.info(f"Batch upload of {len(file_names)} files complete.")
 
         except Exception as e:
             logging.error(f"Error during upload: {e}")
             raise ErrorDuringUpload(str(e))
 
+    def _send_raw(
+        self,
+        src: BinaryIO,
+        progress_cb: Optional[Callable[[int], None]],
+        size: Optional[int] = None,
+    ) -> int:
+        offset = 0
+        while size is None or offset < size:
+            # Bounded sendfile calls keep progress reporting granular.
+            count = IO_BUF if size is None else min(IO_BUF, size - offset)
+            sent = self.client_socket.sendfile(src, offset, count)
+            if not sent:
+                break
+            offset += sent
+            if progress_cb:
+                progress_cb(sent)
+        return offset
+
+    def _send_zip(
+        self,
+        src: BinaryIO,
+        dest: _ChunkedWriter,
+        progress_cb: Optional[Callable[[int], None]],
+    ) -> None:
+        # Deflate straight onto the socket, no temporary archive needed.
+        size = os.fstat(src.fileno()).st_size
+        arcname = os.path.basename(src.name)
+        _zip_stream(src, dest, arcname, size, progress_cb)
+
+    def _send_gzip(
+        self,
+        src: BinaryIO,
+        dest: _ChunkedWriter,
+        progress_cb: Optional[Callable[[int], None]],
+    ) -> None:
+        with _open_parallel_gzip(None, fileobj=dest) as gz:
+            _copy_with_progress(src, gz, progress_cb)
+
+    def _send_zstd(
+        self,
+        src: BinaryIO,
+        dest: _ChunkedWriter,
+        progress_cb: Optional[Callable[[int], None]],
+    ) -> None:
+        size = os.fstat(src.fileno()).st_size
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        with compressor.stream_writer(dest, size=size, closefd=False) as zst:
+            _copy_with_progress(src, zst, progress_cb)
+
     def download(
         self,
         file_name: str,
         decompress: bool = False,
         output_dir: str = ".",
         progress_cb: Optional[Callable[[int], None]] = None,
+        on_size: Optional[Callable[[int], None]] = None,
     ) -> None:
         if not self.client_socket:
             logging.error("Not connected to server.")
@@ -117,35 +481,42 @@ class FileClient:
         try:
             command = f"GET FILE {file_name}\n"
             self.client_socket.sendall(command.encode())
-            line = self.client_socket.recv(1024).decode().strip()
+            line = self._recv_line()
             if line.startswith("ERROR"):
                 raise FileNotFound(line)
             parts = line.split()
             if parts[0] != "READY" or len(parts) != 2:
                 raise ErrorDuringDownload(f"Unexpected response from server: {line}")
             total_size = int(parts[1])
+            if on_size:
+                on_size(total_size)
 
             os.makedirs(output_dir, exist_ok=True)
             output_path = os.path.join(output_dir, file_name)
             received = 0
+            view = self._recv_buffer()
 
             with open(output_path, "wb") as f:
                 while received < total_size:
-                    chunk = self.client_socket.recv(min(4096, total_size - received))
-                    if not chunk:
+                    # Reads larger than the reader's buffer land straight in
+                    # the view; only bytes already buffered are copied.
+                    n = self._reader.readinto(
+                        view[: min(IO_BUF, total_size - received)]
+                    )
+                    if not n:
                         raise PeerDisconnected("Connection lost during download")
-                    f.write(chunk)
-                    received += len(chunk)
+                    f.write(view[:n])
+                    received += n
                     if progress_cb:
-                        progress_cb(len(chunk))
+                        progress_cb(n)
 
             logging.info(f"Download of {file_name} complete.")
 
-            if decompress and output_path.endswith(".zip"):
+            if decompress and output_path.endswith(COMPRESSED_SUFFIXES):
                 self.decompress_file(output_path, output_dir)
                 logging.info(f"Decompressed to {output_dir}: {output_path}")
                 os.remove(output_path)
-                logging.info(f"Removed zip file: {output_path}")
+                logging.info(f"Removed archive: {output_path}")
 
         except FileNotFound:
             raise
@@ -163,7 +534,7 @@ class FileClient:
             command: str = "GET FILES ALL\n"
             self.client_socket.sendall(command.encode())
 
-            files: str = self.client_socket.recv(8192).decode().strip()
+            files: str = self._recv_listing()
             logging.info(f"Files on server:\n{files}")
 
         except Exception as e:
@@ -178,7 +549,7 @@ class FileClient:
             command: str = f"GET FILES {pattern}\n"
             self.client_socket.sendall(command.encode())
 
-            files: str = self.client_socket.recv(8192).decode().strip()
+            files: str = self._recv_listing()
             logging.info(f"Matching files on server:\n{files}")
 
         except Exception as exception:
@@ -190,17 +561,56 @@ class FileClient:
         directory: str,
         compress: bool = False,
         progress_cb: Optional[Callable[[int], None]] = None,
+        codec: str = "deflate",
     ) -> None:
         if not os.path.isdir(directory):
             logging.error(f"Directory {directory} does not exist.")
             return
 
-        for root, _, files in os.walk(directory):
-            for fname in files:
-                path = os.path.join(root, fname)
-                logging.info(f"Sharing file: {path}")
-                self.connect()
-                try:
-                    self.upload(path, compress=compress, progress_cb=progress_cb)
-                finally:
-                    self.disconnect()
+        # Each worker thread keeps one connection open and reuses it for every
+        # file it is handed, instead of a handshake per file.
+        local = threading.local()
+        workers: List[FileClient] = []
+        timeout = SHARE_TIMEOUT if self.timeout is None else self.timeout
+
+        def worker_client() -> "FileClient":
+            client = getattr(local, "client", None)
+            if client is None:
+                client = FileClient(
+                    host=self.host, port=self.port, keepalive=True, timeout=timeout
+                )
+                client.connect()
+                local.client = client
+                workers.append(client)
+            return client
+
+        def upload(path: str) -> None:
+            logging.info(f"Sharing file: {path}")
+            worker_client().upload(
+                path, compress=compress, progress_cb=progress_cb, codec=codec
+            )
+
+        def upload_batch(paths: List[str]) -> None:
+            logging.info(f"Sharing {len(paths)} files")
+            worker_client().upload_batch(paths, progress_cb=progress_cb)
+
+        paths = list(_walk_files(directory))
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=SHARE_CONNECTIONS, thread_name_prefix="fx-share"
+            ) as pool:
+                if compress:
+                    futures = [pool.submit(upload, path) for path in paths]
+                else:
+                    # Raw files need no per-file framing, so each connection
+                    # takes a whole manifest of them per round trip.
+                    futures = [
+                        pool.submit(upload_batch, paths[i : i + SHARE_BATCH_FILES])
+                        for i in range(0, len(paths), SHARE_BATCH_FILES)
+                    ]
+                for future in futures:
+                    future.result()
+        finally:
+            for client in workers:
+                client.disconnect()
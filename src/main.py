@@ -1,5 +1,6 @@
 import logging
 import os
+from typing import Optional
 
 import typer
 from rich.logging import RichHandler
@@ -12,7 +13,6 @@ try:
         ErrorDuringDownload,
         ErrorDuringUpload,
         FileNotFound,
-        PeerDisconnected,
     )
 except ImportError:  # pragma: no cover - allows running as `python main.py`
     from client import FileClient  # type: ignore
@@ -21,13 +21,21 @@ except ImportError:  # pragma: no cover - allows running as `python main.py`
         ErrorDuringDownload,
         ErrorDuringUpload,
         FileNotFound,
-        PeerDisconnected,
     )
 
 logging.basicConfig(
     level=logging.INFO, format="%(message)s", handlers=[RichHandler(show_path=False)]
 )
 
+# Shared by every command so the server address can come from the
+# environment as well as the command line.
+HOST_OPTION = typer.Option(
+    None, "--host", envvar="FILE_EXCHANGER_HOST", help="Server host (default 0.0.0.0)"
+)
+PORT_OPTION = typer.Option(
+    None, "--port", envvar="FILE_EXCHANGER_PORT", help="Server port (default 5050)"
+)
+
 
 class FileExchangerCLI:
     def __init__(self) -> None:
@@ -44,6 +52,14 @@ class FileExchangerCLI:
         self.app.command()(self.list)
         self.app.command()(self.search)
 
+    def _use_address(self, host: Optional[str], port: Optional[int]) -> None:
+        if host is not None:
+            self.client.host = host
+            self.server.host = host
+        if port is not None:
+            self.client.port = port
+            self.server.port = port
+
     def serve(
         self,
         threaded: bool = typer.Option(
@@ -51,10 +67,26 @@ class FileExchangerCLI:
             "--threaded/--async",
             help="Run server in threaded (--threaded) or async (--async) mode",
         ),
+        store_compressed: bool = typer.Option(
+            False,
+            "--store-compressed",
+            help="Keep zstd uploads compressed on disk as <name>.zst",
+        ),
+        workers: int = typer.Option(
+            1,
+            "--workers",
+            min=1,
+            help="Number of server processes sharing the port via SO_REUSEPORT",
+        ),
+        host: Optional[str] = HOST_OPTION,
+        port: Optional[int] = PORT_OPTION,
     ) -> None:
+        self._use_address(host, port)
         mode = "threaded" if threaded else "async"
         logging.info(f"Starting server in {mode} mode…")
         self.server.mode = mode
+        self.server.store_compressed = store_compressed
+        self.server.workers = workers
         self.server.start()
 
     def share(
@@ -63,11 +95,19 @@ class FileExchangerCLI:
             ..., help="Local directory to auto-upload on startup"
         ),
         compress: bool = typer.Option(
-            False, "--compress", help="ZIP files before sharing"
+            False, "--compress", help="Compress files before sharing"
         ),
+        codec: str = typer.Option(
+            "deflate", "--codec", help="Compression codec: deflate or zstd"
+        ),
+        host: Optional[str] = HOST_OPTION,
+        port: Optional[int] = PORT_OPTION,
     ) -> None:
+        self._use_address(host, port)
         try:
-            self.client.share_directory(directory, compress=compress, progress_cb=None)
+            self.client.share_directory(
+                directory, compress=compress, progress_cb=None, codec=codec
+            )
             logging.info(f"Shared directory: {directory}")
         except Exception as e:
             logging.error(f"Error sharing directory: {e}")
@@ -76,20 +116,23 @@ class FileExchangerCLI:
         self,
         file: str = typer.Argument(..., help="Path to file to upload"),
         compress: bool = typer.Option(
-            False, "--compress", help="ZIP file before sending"
+            False, "--compress", help="Compress file before sending"
         ),
+        codec: str = typer.Option(
+            "deflate", "--codec", help="Compression codec: deflate or zstd"
+        ),
+        host: Optional[str] = HOST_OPTION,
+        port: Optional[int] = PORT_OPTION,
     ) -> None:
+        self._use_address(host, port)
         self.client.connect()
         logger = logging.getLogger()
         old_level = logger.level
         logger.setLevel(logging.WARNING)
 
         try:
-            if compress:
-                to_send = self.client.compress_file(file)
-            else:
-                to_send = file
-            total = os.path.getsize(to_send)
+            # Compression is streamed, so progress tracks source bytes read.
+            total = os.path.getsize(file)
         except Exception as e:
             logger.setLevel(old_level)
             logging.error(f"Error: {e}")
@@ -101,14 +144,13 @@ class FileExchangerCLI:
             BarColumn(),
             TextColumn("[green]{task.completed}/{task.total} bytes"),
         ) as progress:
-            task = progress.add_task(
-                f"Uploading {os.path.basename(to_send)}", total=total
-            )
+            task = progress.add_task(f"Uploading {os.path.basename(file)}", total=total)
             try:
                 self.client.upload(
                     file,
                     compress=compress,
                     progress_cb=lambda n: progress.update(task, advance=n),
+                    codec=codec,
                 )
             except FileNotFound as e:
                 logger.setLevel(old_level)
@@ -122,66 +164,56 @@ class FileExchangerCLI:
                 return
 
         logger.setLevel(old_level)
-        logging.info(f"Upload complete: {os.path.basename(to_send)}")
+        logging.info(f"Upload complete: {os.path.basename(file)}")
         self.client.disconnect()
 
     def download(
         self,
         file: str = typer.Argument(..., help="Filename to download"),
         decompress: bool = typer.Option(
-            False, "--decompress", help="Unzip after download"
+            False, "--decompress", help="Decompress .zip/.gz/.zst after download"
         ),
         output_dir: str = typer.Option(
             ".", "--output-dir", "-o", help="Directory to save the file"
         ),
+        host: Optional[str] = HOST_OPTION,
+        port: Optional[int] = PORT_OPTION,
     ) -> None:
+        self._use_address(host, port)
         self.client.connect()
         logger = logging.getLogger()
         old_level = logger.level
         logger.setLevel(logging.WARNING)
         try:
-            self.client.client_socket.sendall(f"GET FILE {file}\n".encode())
-            line = self.client.client_socket.recv(1024).decode().strip()
-            if line.startswith("ERROR"):
-                raise FileNotFound(line)
-            parts = line.split()
-            if parts[0] != "READY" or len(parts) != 2:
-                raise ErrorDuringDownload(f"Unexpected response from server: {line}")
-            total = int(parts[1])
-            os.makedirs(output_dir, exist_ok=True)
-            output_path = os.path.join(output_dir, file)
             with Progress(
                 TextColumn("[cyan]{task.description}"),
                 BarColumn(),
                 TextColumn("[green]{task.completed}/{task.total} bytes"),
             ) as progress:
-                task = progress.add_task(f"Downloading {file}", total=total)
-                received = 0
-                with open(output_path, "wb") as f:
-                    while received < total:
-                        chunk = self.client.client_socket.recv(
-                            min(4096, total - received)
-                        )
-                        if not chunk:
-                            raise PeerDisconnected("Connection lost during download")
-                        f.write(chunk)
-                        received += len(chunk)
-                        progress.update(task, advance=len(chunk))
+                task = progress.add_task(f"Downloading {file}", total=None)
+                self.client.download(
+                    file,
+                    decompress=decompress,
+                    output_dir=output_dir,
+                    progress_cb=lambda n: progress.update(task, advance=n),
+                    on_size=lambda size: progress.update(task, total=size),
+                )
             logger.setLevel(old_level)
             logging.info(f"Download complete: {file}")
-            if decompress and output_path.endswith(".zip"):
-                self.client.decompress_file(output_path, output_dir)
-                logging.info(f"Decompressed to {output_dir}: {output_path}")
-                os.remove(output_path)
-                logging.info(f"Removed zip file: {output_path}")
         except FileNotFound as e:
             logging.error(f"Error: {e}")
         except ErrorDuringDownload as e:
             logging.error(f"Download failed: {e}")
         finally:
+            logger.setLevel(old_level)
             self.client.disconnect()
 
-    def list(self) -> None:
+    def list(
+        self,
+        host: Optional[str] = HOST_OPTION,
+        port: Optional[int] = PORT_OPTION,
+    ) -> None:
+        self._use_address(host, port)
         self.client.connect()
         self.client.list_files()
         self.client.disconnect()
@@ -191,7 +223,10 @@ class FileExchangerCLI:
         pattern: str = typer.Argument(
             ..., help="Wildcard pattern to search (e.g. *.txt)"
         ),
+        host: Optional[str] = HOST_OPTION,
+        port: Optional[int] = PORT_OPTION,
     ) -> None:
+        self._use_address(host, port)
         self.client.connect()
         self.client.search_file(pattern)
         self.client.disconnect()
@@ -1,24 +1,244 @@
 import asyncio
+import fnmatch
+import functools
 import logging
+import multiprocessing
 import os
+import queue
 import re
 import socket
+import stat
 import threading
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
 
 try:
-    from .shared import ErrorDuringUpload, FileNotFound, PeerDisconnected
+    from .shared import (
+        IO_BUF,
+        SOCK_BUF,
+        ErrorDuringUpload,
+        FileNotFound,
+        PeerDisconnected,
+    )
 except ImportError:  # pragma: no cover - script/CLI execution
     from shared import (  # type: ignore
+        IO_BUF,
+        SOCK_BUF,
         ErrorDuringUpload,
         FileNotFound,
         PeerDisconnected,
     )
 
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional dependency
+    uvloop = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
 BASE_DIR = Path(__file__).resolve().parent
 DEFAULT_STORAGE_DIR = str(BASE_DIR / "database")
 
+# LOAD payloads arrive as "<n>\n" + n bytes frames, ended by "0\n". A
+# frame header never needs more than this many bytes.
+CHUNK_HEADER_MAX = 24
+LISTEN_BACKLOG = 4096
+# Seconds a threaded-mode connection may sit without sending or accepting any
+# data before it is closed, so idle clients can't hold every pool thread.
+IDLE_TIMEOUT = 60.0
+LISTING_CACHE_MIN = 10_000
+# Transfers at least this large are dropped from the page cache afterwards so
+# one-shot bulk files don't evict what other clients are reading.
+DROP_CACHE_MIN = 16 * IO_BUF
+ASYNC_READ_CHUNK = 256 * 1024
+ASYNC_WRITE_HIGH = 8 * IO_BUF
+ASYNC_WRITE_LOW = IO_BUF
+ASYNC_DRAIN_AT = 4 * IO_BUF
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_glob(pattern: str) -> "re.Pattern[str]":
+    return re.compile(fnmatch.translate(pattern))
+
+
+def _listing(names: List[str]) -> bytes:
+    # One name per line, then a blank line to end the listing so a client
+    # can read it in full and keep using the connection.
+    return "".join(f"{name}\n" for name in names).encode() + b"\n"
+
+
+def _copy_exact(
+    read: Callable[[int], bytes], write: Callable[[bytes], object], size: int
+) -> None:
+    while size:
+        chunk = read(min(IO_BUF, size))
+        if not chunk:
+            raise PeerDisconnected("Connection lost during upload")
+        write(chunk)
+        size -= len(chunk)
+
+
+async def _copy_exact_async(
+    reader: asyncio.StreamReader, write: Callable[[bytes], object], size: int
+) -> None:
+    while size:
+        chunk = await reader.read(min(IO_BUF, size))
+        if not chunk:
+            raise PeerDisconnected("Connection lost during upload")
+        write(chunk)
+        size -= len(chunk)
+
+
+def _chunk_size(line: bytes) -> int:
+    if not line:
+        raise PeerDisconnected("Connection lost during upload")
+    size = line.rstrip(b"\n")
+    if not line.endswith(b"\n") or not size.isdigit():
+        # The stream can't be resynchronised after a bad header.
+        raise PeerDisconnected(f"Bad chunk header {line[:CHUNK_HEADER_MAX]!r}")
+    return int(size)
+
+
+def _copy_chunks(reader: BinaryIO, write: Callable[[bytes], object]) -> None:
+    # Length-prefixed frames: payload bytes are never scanned, so an upload
+    # may contain anything, and the stream needs no total size up front.
+    while True:
+        size = _chunk_size(reader.readline(CHUNK_HEADER_MAX))
+        if not size:
+            return
+        _copy_exact(reader.read1, write, size)
+
+
+async def _copy_chunks_async(
+    reader: asyncio.StreamReader, write: Callable[[bytes], object]
+) -> None:
+    while True:
+        size = _chunk_size(await reader.readline())
+        if not size:
+            return
+        await _copy_exact_async(reader, write, size)
+
+
+def _parse_manifest_line(line: bytes) -> Tuple[str, int]:
+    # <name>\t<size>; splitting from the right tolerates tabs in names.
+    name, _, size = line.decode().rstrip("\n").rpartition("\t")
+    if not size.isdigit():
+        # isdigit() also rules out a sign, so negative sizes end up here.
+        raise ErrorDuringUpload(f"Bad manifest size {size!r} for {name!r}")
+    return os.path.basename(name), int(size)
+
+
+_REUSE_PORT = hasattr(socket, "SO_REUSEPORT")
+# Linux calls it TCP_CORK, macOS/BSD TCP_NOPUSH.
+_TCP_CORK = getattr(socket, "TCP_CORK", getattr(socket, "TCP_NOPUSH", None))
+
+
+def _tune_connection(conn: socket.socket) -> None:
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF)
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF)
+    if conn.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    # Small replies (READY, OK, listings) must not wait on Nagle; bulk sends
+    # are coalesced explicitly with _set_cork instead.
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):
+        # Acknowledge the first upload segments immediately instead of
+        # letting the client's window stall on delayed ACKs.
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+
+def _set_cork(sock: socket.socket, enabled: bool) -> None:
+    if _TCP_CORK is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, _TCP_CORK, int(enabled))
+    except OSError:
+        pass
+
+
+def _fadvise(fd: int, advice: str) -> None:
+    # posix_fadvise only exists on Linux and some BSDs.
+    try:
+        os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+    except (AttributeError, OSError):
+        pass
+
+
+def _load_codec(args: List[str]) -> str:
+    # LOAD <label> [COMPRESSED [DEFLATE|ZSTD]]; bare COMPRESSED is deflate.
+    if len(args) >= 3 and args[1].upper() == "COMPRESSED":
+        return args[2].upper()
+    return ""
+
+
+class _UploadSink:
+    # Where upload payloads are written. Once opening or writing a file fails
+    # it swallows the rest, so the handler still reads every declared byte
+    # and the connection stays in step; check() then raises the first error.
+    def __init__(self) -> None:
+        self._error: Optional[Exception] = None
+        self._write: Optional[Callable[[bytes], object]] = None
+
+    def open(self, path: str) -> Optional[BinaryIO]:
+        self._write = None
+        if self._error is None:
+            try:
+                return open(path, "wb")
+            except OSError as e:
+                self._error = e
+        return None
+
+    def target(self, write: Callable[[bytes], object]) -> None:
+        self._write = write
+
+    def write(self, data: bytes) -> None:
+        if self._error is not None or self._write is None:
+            return
+        try:
+            self._write(data)
+        except Exception as e:
+            self._error = e
+
+    def check(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+
+class _WorkerPool:
+    # ThreadPoolExecutor joins its non-daemon workers at interpreter exit,
+    # which would hang for as long as any client keeps its connection open.
+    # Same reuse-idle-threads scheme, with daemon workers.
+    def __init__(self, max_workers: int, name: str) -> None:
+        self._max_workers = max_workers
+        self._name = name
+        self._tasks: "queue.SimpleQueue[Tuple[Callable[..., Any], tuple]]" = (
+            queue.SimpleQueue()
+        )
+        self._idle = threading.Semaphore(0)
+        self._threads = 0
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        self._tasks.put((fn, args))
+        if self._idle.acquire(blocking=False):
+            return
+        if self._threads < self._max_workers:
+            self._threads += 1
+            threading.Thread(
+                target=self._work, name=f"{self._name}_{self._threads}", daemon=True
+            ).start()
+
+    def _work(self) -> None:
+        while True:
+            fn, args = self._tasks.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                logging.error("Worker error: %s", e)
+            self._idle.release()
+
 
 class FileServer:
     def __init__(
@@ -27,64 +247,172 @@ class FileServer:
         port: int = 5050,
         storage_dir: str = DEFAULT_STORAGE_DIR,
         mode: str = "threaded",
+        store_compressed: bool = False,
+        workers: int = 1,
+        unix_path: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        idle_timeout: Optional[float] = IDLE_TIMEOUT,
     ) -> None:
         self.host: str = host
         self.port: int = port
         self.storage_dir: str = storage_dir
         os.makedirs(self.storage_dir, exist_ok=True)
         self.mode: str = mode
-        logging.info(f"Storage directory set to {self.storage_dir}")
+        self.store_compressed: bool = store_compressed
+        self.workers: int = workers
+        # Listen on a Unix domain socket at this path instead of host:port.
+        self.unix_path: Optional[str] = unix_path
+        # Size of the threaded mode's connection pool. Each open connection
+        # ties up one pool thread until it closes or idles out, so this must
+        # exceed the number of clients that keep their connections open.
+        self.max_workers: int = max_workers or min(256, (os.cpu_count() or 1) * 16)
+        self.idle_timeout: Optional[float] = idle_timeout
+        self._listing_cache: Tuple[int, List[str]] = (-1, [])
+        self._commands: Dict[str, Callable[..., None]] = {
+            "LOAD": self._dispatch_load,
+            "GET": self._dispatch_get,
+            "BATCH": self._dispatch_batch,
+        }
+        self._get_commands: Dict[str, Callable[..., None]] = {
+            "FILE": self._cmd_get_file,
+            "FILES": self._cmd_get_files,
+        }
+        self._async_commands: Dict[str, Callable[..., Awaitable[None]]] = {
+            "LOAD": self._dispatch_load_async,
+            "GET": self._dispatch_get_async,
+            "BATCH": self._dispatch_batch_async,
+        }
+        self._async_get_commands: Dict[str, Callable[..., Awaitable[None]]] = {
+            "FILE": self._cmd_get_file_async,
+            "FILES": self._cmd_get_files_async,
+        }
+        logging.info("Storage directory set to %s", self.storage_dir)
 
     def start(self) -> None:
+        if self._reuse_port() and self.unix_path is None:
+            # Each process binds its own SO_REUSEPORT listener on the same
+            # port and the kernel spreads new connections across them.
+            for i in range(1, self.workers):
+                multiprocessing.Process(
+                    target=self._serve, name=f"fx-worker-{i}", daemon=True
+                ).start()
+        elif self.workers > 1:
+            logging.warning(
+                "Multiple workers need a TCP listener with SO_REUSEPORT; "
+                "running one worker"
+            )
+        self._serve()
+
+    def _serve(self) -> None:
         if self.mode == "threaded":
             self._start_threaded()
         else:
-            asyncio.run(self._start_async())
+            if uvloop is None:
+                asyncio.run(self._start_async())
+                return
+            # A private loop, so the process-wide event loop policy is left
+            # alone for whoever embeds the server.
+            loop = uvloop.new_event_loop()
+            try:
+                loop.run_until_complete(self._start_async())
+            finally:
+                loop.close()
 
     def _start_threaded(self) -> None:
+        if self.unix_path is not None:
+            sock = self._bind_unix()
+        else:
+            sock = self._bind_tcp()
+        sock.listen(LISTEN_BACKLOG)
+        logging.info("Threaded server listening on %s", self._address())
+        # A bounded pool caps memory and context switching under connection
+        # bursts; excess connections queue until a worker frees up.
+        pool = _WorkerPool(self.max_workers, "fx-io")
+        while True:
+            conn, addr = sock.accept()
+            pool.submit(self._handle_client, conn, addr)
+
+    def _reuse_port(self) -> bool:
+        # Only worker processes share the port; a single server keeps it to
+        # itself so a second instance fails to bind instead of splitting the
+        # traffic with it.
+        return self.workers > 1 and _REUSE_PORT
+
+    def _bind_tcp(self) -> socket.socket:
         sock = socket.socket()
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self._reuse_port():
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Accepted sockets inherit these; they must be set before the handshake.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF)
         sock.bind((self.host, self.port))
-        sock.listen()
-        logging.info(f"Threaded server listening on {self.host}:{self.port}")
-        while True:
-            conn, addr = sock.accept()
-            threading.Thread(
-                target=self._handle_client, args=(conn, addr), daemon=True
-            ).start()
+        return sock
+
+    def _bind_unix(self) -> socket.socket:
+        # Like asyncio's start_unix_server, replace a stale socket file left
+        # behind by a previous run, but never any other kind of file.
+        try:
+            if stat.S_ISSOCK(os.stat(self.unix_path).st_mode):
+                os.remove(self.unix_path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.unix_path)
+        return sock
+
+    def _address(self) -> str:
+        if self.unix_path is not None:
+            return self.unix_path
+        return f"{self.host}:{self.port}"
 
     async def _start_async(self) -> None:
-        server = await asyncio.start_server(
-            self._handle_client_async, self.host, self.port
-        )
-        logging.info(f"Async server listening on {self.host}:{self.port}")
+        if self.unix_path is not None:
+            server = await asyncio.start_unix_server(
+                self._handle_client_async,
+                self.unix_path,
+                limit=IO_BUF,
+                backlog=LISTEN_BACKLOG,
+            )
+        else:
+            server = await asyncio.start_server(
+                self._handle_client_async,
+                self.host,
+                self.port,
+                limit=IO_BUF,
+                backlog=LISTEN_BACKLOG,
+                reuse_port=self._reuse_port(),
+            )
+        logging.info("Async server listening on %s", self._address())
         async with server:
             await server.serve_forever()
 
     def _handle_client(self, conn: socket.socket, addr: Tuple[str, int]) -> None:
         try:
-            with conn:
-                buffer = b""
-                while True:
-                    data = conn.recv(1024)
-                    if not data:
-                        break
-                    buffer += data
-                    while b"\n" in buffer:
-                        line, buffer = buffer.split(b"\n", 1)
-                        self._dispatch_command(conn, addr, line.decode().strip())
+            _tune_connection(conn)
+            conn.settimeout(self.idle_timeout)
+            # The buffered reader splits lines in C and keeps any bytes read
+            # past a command line for the handler that consumes them.
+            with conn, conn.makefile("rb", buffering=IO_BUF) as reader:
+                for line in reader:
+                    self._dispatch_command(reader, conn, addr, line.decode().strip())
         except ConnectionResetError:
             pass
+        except socket.timeout:
+            logging.info("[%s] Idle for %ss, closing", addr, self.idle_timeout)
         except Exception as e:
-            logging.error(f"[{addr}] Error: {e}")
+            logging.error("[%s] Error: %s", addr, e)
         finally:
             conn.close()
-            logging.info(f"[-] Connection closed: {addr}")
+            logging.info("[-] Connection closed: %s", addr)
 
     async def _handle_client_async(
         self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
     ) -> None:
         addr = writer.get_extra_info("peername")
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            _tune_connection(sock)
         try:
             while not reader.at_eof():
                 data = await reader.readline()
@@ -95,44 +423,41 @@ class FileServer:
         except ConnectionResetError:
             pass
         except Exception as e:
-            logging.error(f"[{addr}] Async error: {e}")
+            logging.error("[%s] Async error: %s", addr, e)
         finally:
             writer.close()
             try:
                 await writer.wait_closed()
             except ConnectionResetError:
                 pass
-            logging.info(f"[-] Async connection closed: {addr}")
+            logging.info("[-] Async connection closed: %s", addr)
 
     def _dispatch_command(
-        self, peer: socket.socket, addr: Tuple[str, int], line: str
+        self,
+        reader: BinaryIO,
+        peer: socket.socket,
+        addr: Tuple[str, int],
+        line: str,
     ) -> None:
-        logging.info(f"[{addr}] Command received: {line}")
-        parts = line.split()
-        if not parts:
+        logging.info("[%s] Command received: %s", addr, line)
+        cmd, _, args = line.partition(" ")
+        if not cmd:
             return
-        cmd = parts[0].upper()
+        handler = self._commands.get(cmd.upper())
         try:
-            if cmd == "LOAD":
-                filename = parts[1]
-                self._cmd_load(peer, addr, filename)
-                return
-            elif cmd == "GET" and len(parts) >= 3:
-                sub = parts[1].upper()
-                if sub == "FILE":
-                    self._cmd_get_file(peer, addr, parts[2])
-                elif sub == "FILES":
-                    self._cmd_get_files(peer, addr, parts[2])
-                else:
-                    peer.sendall(b"ERROR Unknown GET subcommand\n")
-            else:
+            if handler is None:
                 peer.sendall(b"ERROR Unknown command\n")
+            else:
+                handler(reader, peer, addr, args.lstrip())
         except FileNotFound as e:
             peer.sendall(f"ERROR FileNotFound {e}\n".encode())
         except ErrorDuringUpload as e:
             peer.sendall(f"ERROR ErrorDuringUpload {e}\n".encode())
         except PeerDisconnected as e:
+            # The rest of the stream can't be told apart from commands any
+            # more, so end the session after replying.
             peer.sendall(f"ERROR PeerDisconnected {e}\n".encode())
+            raise
         except Exception as e:
             peer.sendall(f"ERROR {e}\n".encode())
 
@@ -143,44 +468,139 @@ class FileServer:
         addr: Tuple[str, int],
         line: str,
     ) -> None:
-        parts = line.split()
-        cmd = parts[0].upper() if parts else ""
-        if cmd == "LOAD":
-            filename = parts[1]
-            await self._cmd_load_async(reader, writer, addr, filename)
-            return
-        elif cmd == "GET" and len(parts) >= 3:
-            sub = parts[1].upper()
-            if sub == "FILE":
-                await self._cmd_get_file_async(writer, addr, parts[2])
-            elif sub == "FILES":
-                await self._cmd_get_files_async(writer, addr, parts[2])
-        else:
+        cmd, _, args = line.partition(" ")
+        handler = self._async_commands.get(cmd.upper())
+        if handler is None:
             writer.write(b"ERROR Unknown command\n")
             await writer.drain()
+        else:
+            await handler(reader, writer, addr, args.lstrip())
+
+    def _dispatch_load(
+        self, reader: BinaryIO, peer: socket.socket, addr: Tuple[str, int], args: str
+    ) -> None:
+        parts = args.split()
+        self._cmd_load(reader, peer, addr, parts[0], _load_codec(parts))
+
+    def _dispatch_get(
+        self, reader: BinaryIO, peer: socket.socket, addr: Tuple[str, int], args: str
+    ) -> None:
+        sub, _, target = args.partition(" ")
+        handler = self._get_commands.get(sub.upper())
+        target = target.strip()
+        if handler is None or not target:
+            peer.sendall(b"ERROR Unknown GET subcommand\n")
+            return
+        handler(peer, addr, target)
+
+    def _dispatch_batch(
+        self, reader: BinaryIO, peer: socket.socket, addr: Tuple[str, int], args: str
+    ) -> None:
+        sub, _, count = args.partition(" ")
+        count = count.strip()
+        if sub.upper() != "LOAD" or not count.isdigit():
+            peer.sendall(b"ERROR Unknown BATCH subcommand\n")
+            return
+        self._cmd_batch_load(reader, peer, addr, int(count))
+
+    async def _dispatch_load_async(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        addr: Tuple[str, int],
+        args: str,
+    ) -> None:
+        parts = args.split()
+        await self._cmd_load_async(reader, writer, addr, parts[0], _load_codec(parts))
+
+    async def _dispatch_get_async(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        addr: Tuple[str, int],
+        args: str,
+    ) -> None:
+        sub, _, target = args.partition(" ")
+        handler = self._async_get_commands.get(sub.upper())
+        target = target.strip()
+        if handler is None or not target:
+            writer.write(b"ERROR Unknown GET subcommand\n")
+            await writer.drain()
+            return
+        await handler(writer, addr, target)
+
+    async def _dispatch_batch_async(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        addr: Tuple[str, int],
+        args: str,
+    ) -> None:
+        sub, _, count = args.partition(" ")
+        count = count.strip()
+        if sub.upper() != "LOAD" or not count.isdigit():
+            writer.write(b"ERROR Unknown BATCH subcommand\n")
+            await writer.drain()
+            return
+        await self._cmd_batch_load_async(reader, writer, addr, int(count))
+
+    def _check_codec(self, codec: str) -> None:
+        if codec == "ZSTD" and not self.store_compressed and zstandard is None:
+            raise ErrorDuringUpload("zstandard is not installed on the server")
+
+    def _upload_path(self, filename: str, codec: str) -> str:
+        if codec == "ZSTD" and self.store_compressed:
+            filename = f"{filename}.zst"
+        return os.path.join(self.storage_dir, filename)
+
+    def _upload_writer(self, f: BinaryIO, codec: str) -> Callable[[bytes], object]:
+        # zstd is a transport encoding: decode it on the way to disk unless
+        # the server keeps uploads compressed.
+        if codec != "ZSTD" or self.store_compressed:
+            return f.write
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+        def write(data: bytes) -> None:
+            # A finished frame rejects further calls, even empty ones.
+            if data:
+                f.write(decompressor.decompress(data))
+
+        return write
 
     def _cmd_load(
-        self, peer: socket.socket, addr: Tuple[str, int], filename: str
+        self,
+        reader: BinaryIO,
+        peer: socket.socket,
+        addr: Tuple[str, int],
+        filename: str,
+        codec: str = "",
     ) -> None:
+        self._check_codec(codec)
         peer.sendall(b"READY\n")
-        file_path = os.path.join(self.storage_dir, filename)
+        sink = _UploadSink()
         try:
-            with open(file_path, "wb") as f:
-                buffer = b""
-                while True:
-                    chunk = peer.recv(4096)
-                    if not chunk:
-                        raise PeerDisconnected("Connection lost during upload")
-                    buffer += chunk
-                    if b"<END>\n" in buffer:
-                        content, _ = buffer.split(b"<END>\n", 1)
-                        f.write(content)
-                        break
-                    f.write(buffer)
-                    buffer = b""
-            logging.info(f"[{addr}] Upload complete: {filename}")
+            f = sink.open(self._upload_path(filename, codec))
+            try:
+                if f is not None:
+                    self._forget_listing()
+                    _fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+                    sink.target(self._upload_writer(f, codec))
+                _copy_chunks(reader, sink.write)
+                sink.check()
+                if f.tell() >= DROP_CACHE_MIN:
+                    # Dirty pages can't be dropped until they are on disk.
+                    f.flush()
+                    os.fsync(f.fileno())
+                    _fadvise(f.fileno(), "POSIX_FADV_DONTNEED")
+            finally:
+                if f is not None:
+                    f.close()
+            peer.sendall(b"OK\n")
+            logging.info("[%s] Upload complete: %s", addr, filename)
+        except PeerDisconnected:
+            raise
         except Exception as e:
-            logging.error(f"[{addr}] Upload error: {e}")
+            logging.error("[%s] Upload error: %s", addr, e)
             raise ErrorDuringUpload(e)
 
     async def _cmd_load_async(
@@ -189,26 +609,121 @@ class FileServer:
         writer: asyncio.StreamWriter,
         addr: Tuple[str, int],
         filename: str,
+        codec: str = "",
     ) -> None:
+        try:
+            self._check_codec(codec)
+        except ErrorDuringUpload as e:
+            writer.write(f"ERROR ErrorDuringUpload {e}\n".encode())
+            await writer.drain()
+            return
         writer.write(b"READY\n")
         await writer.drain()
-        file_path = os.path.join(self.storage_dir, filename)
+        sink = _UploadSink()
         try:
-            with open(file_path, "wb") as f:
-                while True:
-                    chunk = await reader.read(4096)
-                    if not chunk:
-                        raise PeerDisconnected("Connection lost during upload")
-                    if b"<END>\n" in chunk:
-                        content, _ = chunk.split(b"<END>\n", 1)
-                        f.write(content)
-                        break
-                    f.write(chunk)
-            logging.info(f"[{addr}] Upload complete: {filename}")
+            f = sink.open(self._upload_path(filename, codec))
+            try:
+                if f is not None:
+                    self._forget_listing()
+                    _fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+                    sink.target(self._upload_writer(f, codec))
+                await _copy_chunks_async(reader, sink.write)
+                sink.check()
+            finally:
+                if f is not None:
+                    f.close()
+        except PeerDisconnected:
+            raise
         except Exception as e:
-            logging.error(f"[{addr}] Upload error: {e}")
+            logging.error("[%s] Upload error: %s", addr, e)
+            writer.write(f"ERROR ErrorDuringUpload {e}\n".encode())
+            await writer.drain()
+            return
+        writer.write(b"OK\n")
+        await writer.drain()
+        logging.info("[%s] Upload complete: %s", addr, filename)
+
+    def _cmd_batch_load(
+        self, reader: BinaryIO, peer: socket.socket, addr: Tuple[str, int], count: int
+    ) -> None:
+        # BATCH LOAD <n>, n manifest lines, then the payloads back to back.
+        # Sizes are known up front, so no end marker has to be scanned for.
+        # Read the whole manifest before validating it, so a rejected batch
+        # leaves no manifest lines behind to be taken for commands.
+        lines = []
+        for _ in range(count):
+            line = reader.readline()
+            if not line:
+                raise PeerDisconnected("Connection lost during batch manifest")
+            lines.append(line)
+        entries = [_parse_manifest_line(line) for line in lines]
+        peer.sendall(b"READY\n")
+        sink = _UploadSink()
+        try:
+            for filename, size in entries:
+                f = sink.open(os.path.join(self.storage_dir, filename))
+                try:
+                    if f is not None:
+                        self._forget_listing()
+                        sink.target(f.write)
+                    _copy_exact(reader.read1, sink.write, size)
+                finally:
+                    if f is not None:
+                        f.close()
+            sink.check()
+            peer.sendall(b"OK\n")
+            logging.info("[%s] Batch upload complete: %d files", addr, count)
+        except PeerDisconnected:
+            raise
+        except Exception as e:
+            logging.error("[%s] Batch upload error: %s", addr, e)
             raise ErrorDuringUpload(e)
 
+    async def _cmd_batch_load_async(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        addr: Tuple[str, int],
+        count: int,
+    ) -> None:
+        lines = []
+        for _ in range(count):
+            line = await reader.readline()
+            if not line:
+                raise PeerDisconnected("Connection lost during batch manifest")
+            lines.append(line)
+        try:
+            entries = [_parse_manifest_line(line) for line in lines]
+        except ErrorDuringUpload as e:
+            writer.write(f"ERROR ErrorDuringUpload {e}\n".encode())
+            await writer.drain()
+            return
+        writer.write(b"READY\n")
+        await writer.drain()
+        sink = _UploadSink()
+        try:
+            for filename, size in entries:
+                f = sink.open(os.path.join(self.storage_dir, filename))
+                try:
+                    if f is not None:
+                        self._forget_listing()
+                        sink.target(f.write)
+                    await _copy_exact_async(reader, sink.write, size)
+                finally:
+                    if f is not None:
+                        f.close()
+            sink.check()
+        except PeerDisconnected:
+            raise
+        except Exception as e:
+            logging.error("[%s] Batch upload error: %s", addr, e)
+            writer.write(f"ERROR ErrorDuringUpload {e}\n".encode())
+            await writer.drain()
+            return
+        writer.write(b"OK\n")
+        await writer.drain()
+        logging.info("[%s] Batch upload complete: %d files", addr, count)
+
     def _cmd_get_file(
         self, peer: socket.socket, addr: Tuple[str, int], filename: str
     ) -> None:
@@ -217,15 +732,22 @@ class FileServer:
             peer.sendall(f"ERROR FileNotFound {filename}\n".encode())
             return
         size = os.path.getsize(path)
-        peer.sendall(f"READY {size}\n".encode())
-        with open(path, "rb") as f:
-            while True:
-                chunk = f.read(4096)
-                if not chunk:
-                    break
-                peer.sendall(chunk)
-        peer.sendall(b"<END>\n")
-        logging.info(f"[{addr}] File sent: {filename}")
+        # Cork so the READY header rides in the same segment as the first
+        # payload bytes; uncorking flushes the tail.
+        _set_cork(peer, True)
+        try:
+            peer.sendall(f"READY {size}\n".encode())
+            with open(path, "rb") as f:
+                _fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+                # sendfile() rejects a zero count, and an empty file has
+                # nothing to send after the header anyway.
+                if size:
+                    peer.sendfile(f, 0, size)
+                if size >= DROP_CACHE_MIN:
+                    _fadvise(f.fileno(), "POSIX_FADV_DONTNEED")
+        finally:
+            _set_cork(peer, False)
+        logging.info("[%s] File sent: %s", addr, filename)
 
     async def _cmd_get_file_async(
         self, writer: asyncio.StreamWriter, addr: Tuple[str, int], filename: str
@@ -237,37 +759,67 @@ class FileServer:
             return
         size = os.path.getsize(path)
         writer.write(f"READY {size}\n".encode())
-        await writer.drain()
         with open(path, "rb") as f:
-            while True:
-                chunk = f.read(4096)
-                if not chunk:
-                    break
-                writer.write(chunk)
-                await writer.drain()
-        writer.write(b"<END>\n")
-        await writer.drain()
-        logging.info(f"[{addr}] File sent: {filename}")
+            _fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+            try:
+                # loop.sendfile() rejects a zero count, like socket.sendfile().
+                if size:
+                    loop = asyncio.get_running_loop()
+                    await loop.sendfile(writer.transport, f, 0, size)
+            except NotImplementedError:
+                # uvloop has no loop.sendfile; stream chunks and only wait for
+                # the socket once the transport has buffered a fair amount.
+                writer.transport.set_write_buffer_limits(
+                    high=ASYNC_WRITE_HIGH, low=ASYNC_WRITE_LOW
+                )
+                while True:
+                    chunk = f.read(ASYNC_READ_CHUNK)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    if writer.transport.get_write_buffer_size() > ASYNC_DRAIN_AT:
+                        await writer.drain()
+            await writer.drain()
+            if size >= DROP_CACHE_MIN:
+                _fadvise(f.fileno(), "POSIX_FADV_DONTNEED")
+        logging.info("[%s] File sent: %s", addr, filename)
+
+    def _forget_listing(self) -> None:
+        # Called once an upload has created its file: a file created within
+        # the same mtime tick as the cached listing leaves the directory mtime
+        # unchanged, so the mtime check alone would keep serving the old one.
+        self._listing_cache = (-1, [])
+
+    def _list_names(self) -> List[str]:
+        # Creating or removing an entry bumps the directory mtime, so a big
+        # listing can be reused until that changes.
+        mtime = os.stat(self.storage_dir).st_mtime_ns
+        cached_mtime, cached_names = self._listing_cache
+        if mtime == cached_mtime:
+            return cached_names
+        with os.scandir(self.storage_dir) as entries:
+            names = sorted(entry.name for entry in entries)
+        if len(names) >= LISTING_CACHE_MIN:
+            self._listing_cache = (mtime, names)
+        return names
+
+    def _list_matches(self, pattern: str) -> List[str]:
+        if pattern.upper() == "ALL":
+            return self._list_names()
+        regex = _compile_glob(pattern)
+        return [name for name in self._list_names() if regex.match(name)]
 
     def _cmd_get_files(
         self, peer: socket.socket, addr: Tuple[str, int], pattern: str
     ) -> None:
-        if pattern.upper() == "ALL":
-            regex = re.compile(".*")
-        else:
-            regex = re.compile("^" + pattern.replace("*", ".*") + "$")
-        matches = [f for f in os.listdir(self.storage_dir) if regex.match(f)]
-        peer.sendall(("\n".join(matches) + "\n").encode())
-        logging.info(f"[{addr}] Sent list of {len(matches)} files")
+        matches = self._list_matches(pattern)
+        peer.sendall(_listing(matches))
+        logging.info("[%s] Sent list of %d files", addr, len(matches))
 
     async def _cmd_get_files_async(
         self, writer: asyncio.StreamWriter, addr: Tuple[str, int], pattern: str
     ) -> None:
-        if pattern.upper() == "ALL":
-            regex = re.compile(".*")
-        else:
-            regex = re.compile("^" + pattern.replace("*", ".*") + "$")
-        matches = [f for f in os.listdir(self.storage_dir) if regex.match(f)]
-        writer.write(("\n".join(matches) + "\n").encode())
+        matches = self._list_matches(pattern)
+        writer.write(_listing(matches))
         await writer.drain()
-        logging.info(f"[{addr}] Sent list of {len(matches)} files")
+        logging.info("[%s] Sent list of %d files", addr, len(matches))
@@ -1,4 +1,6 @@
 from .shared import (
+    IO_BUF,
+    SOCK_BUF,
     ErrorDuringDownload,
     ErrorDuringUpload,
     FileNotFound,
@@ -6,6 +8,8 @@ from .shared import (
 )
 
 __all__ = [
+    "IO_BUF",
+    "SOCK_BUF",
     "FileNotFound",
     "ErrorDuringUpload",
     "ErrorDuringDownload",
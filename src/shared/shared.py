@@ -1,3 +1,10 @@
+IO_BUF = 1 << 20
+"""Chunk size used for file and socket copy loops on both peers."""
+
+SOCK_BUF = 4 << 20
+"""Kernel send/receive buffer size requested for transfer sockets."""
+
+
 class FileNotFound(Exception):
     """Raised when a requested file is not found on the server or client."""
 
@@ -0,0 +1,129 @@
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from unittest import mock
+
+import server as server_module
+from server import FileServer
+
+HOST = "127.0.0.1"
+# tmpfs on most Linux hosts; test storage needs no durability.
+_SHM = "/dev/shm"  # noqa: S108
+
+_storage: Optional[tempfile.TemporaryDirectory] = None
+_sockets: Optional[tempfile.TemporaryDirectory] = None
+_ports: Dict[Tuple[str, bool], int] = {}
+_unix_paths: Dict[Tuple[str, bool], str] = {}
+_lock = threading.Lock()
+
+
+def _wait_until_listening(family: int, address: Any, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(0.05)
+            try:
+                sock.connect(address)
+                if family != socket.AF_UNIX:
+                    # Reset instead of FIN so the probe leaves no TIME_WAIT.
+                    sock.setsockopt(
+                        socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                    )
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+        time.sleep(0.001)
+
+
+def fast_tmpdir() -> tempfile.TemporaryDirectory:
+    if os.path.isdir(_SHM) and os.access(_SHM, os.W_OK):
+        return tempfile.TemporaryDirectory(dir=_SHM)
+    return tempfile.TemporaryDirectory()
+
+
+def _storage_dir() -> str:
+    global _storage
+    if _storage is None:
+        _storage = fast_tmpdir()
+    return _storage.name
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def _run(
+    server: FileServer, family: int, address: Any, use_uvloop: bool = True
+) -> threading.Thread:
+    # Async servers pick their event loop when they start, so hiding uvloop
+    # until the server listens gives it the stdlib loop.
+    uvloop = server_module.uvloop if use_uvloop else None
+    with mock.patch.object(server_module, "uvloop", uvloop):
+        thread = threading.Thread(target=server.start, daemon=True)
+        thread.start()
+        _wait_until_listening(family, address)
+    return thread
+
+
+def start_server(
+    storage_dir: str, use_uvloop: bool = True, **options: Any
+) -> Tuple[int, threading.Thread]:
+    options = {"mode": "threaded", "max_workers": 4, **options}
+    port = free_port()
+    server = FileServer(host=HOST, port=port, storage_dir=storage_dir, **options)
+    return port, _run(server, socket.AF_INET, (HOST, port), use_uvloop)
+
+
+def shared_server(
+    mode: str = "threaded", use_uvloop: bool = True
+) -> Tuple[str, int, str]:
+    # One server per mode (and event loop) and test process, started by
+    # whichever test class needs it first; classes share it and clear the
+    # storage between tests.
+    key = (mode, use_uvloop)
+    with _lock:
+        if key not in _ports:
+            _ports[key], _ = start_server(_storage_dir(), use_uvloop, mode=mode)
+        return HOST, _ports[key], _storage_dir()
+
+
+def shared_unix_server(
+    mode: str = "threaded", use_uvloop: bool = True
+) -> Tuple[str, str]:
+    # Same storage as shared_server(), reached over a Unix domain socket so
+    # in-process protocol tests skip the loopback TCP stack. The socket files
+    # live outside the storage so listings and clear_storage never see them.
+    # One server per mode and event loop, so protocol tests can run on each.
+    global _sockets
+    key = (mode, use_uvloop)
+    with _lock:
+        if key not in _unix_paths:
+            if _sockets is None:
+                _sockets = fast_tmpdir()
+            name = mode if use_uvloop else f"{mode}-stdlib"
+            path = os.path.join(_sockets.name, f"{name}.sock")
+            server = FileServer(
+                unix_path=path,
+                storage_dir=_storage_dir(),
+                mode=mode,
+                max_workers=4,
+            )
+            _run(server, socket.AF_UNIX, path, use_uvloop)
+            _unix_paths[key] = path
+        return _unix_paths[key], _storage_dir()
+
+
+def clear_storage(storage: str) -> None:
+    for entry in os.scandir(storage):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
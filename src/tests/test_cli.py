@@ -1,45 +1,32 @@
-import tempfile
-import threading
-import time
 import unittest
 
 from typer.testing import CliRunner
 
 from main import FileExchangerCLI
-from server import FileServer
+
+try:
+    from ._net import clear_storage, shared_server
+except ImportError:  # pragma: no cover - run via `unittest discover tests`
+    from _net import clear_storage, shared_server  # type: ignore
 
 
 class TestCLI(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.storage = tempfile.TemporaryDirectory()
-        cls.host = "127.0.0.1"
-        cls.port = 5000
-        server = FileServer(
-            host=cls.host,
-            port=cls.port,
-            storage_dir=cls.storage.name,
-            mode="threaded",
-        )
-        cls.thread = threading.Thread(target=server.start, daemon=True)
-        cls.thread.start()
-        time.sleep(0.1)
-
-    @classmethod
-    def tearDownClass(cls):
-        cls.storage.cleanup()
+        cls.host, cls.port, cls.storage_dir = shared_server()
+        cls.runner = CliRunner()
+        cls.app = FileExchangerCLI().app
 
     def setUp(self):
-        self.runner = CliRunner()
-        self.cli = FileExchangerCLI()
-        self.cli.client.host = self.__class__.host
-        self.cli.client.port = self.__class__.port
+        clear_storage(self.storage_dir)
 
     def test_help_lists_commands(self):
-        result = self.runner.invoke(self.cli.app, ["--help"])
+        result = self.runner.invoke(self.app, ["--help"])
         self.assertIn("serve", result.output)
         self.assertIn("share", result.output)
 
     def test_list_empty(self):
-        result = self.runner.invoke(self.cli.app, ["list"])
+        result = self.runner.invoke(
+            self.app, ["list", "--host", self.host, "--port", str(self.port)]
+        )
         self.assertEqual(result.exit_code, 0)
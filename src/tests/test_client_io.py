@@ -1,28 +1,62 @@
+import io
 import os
-import tempfile
 import unittest
+import zipfile
+import zlib
+from types import SimpleNamespace
+from unittest import mock
 
-from client import FileClient
+import client as client_module
+from client import FileClient, _deflate_backend, _ZipFile
+
+try:
+    from isal import isal_zlib
+except ImportError:  # pragma: no cover - optional dependency
+    isal_zlib = None
 
 
 class TestClientCompressDecompress(unittest.TestCase):
     def setUp(self):
-        self.tmp = tempfile.TemporaryDirectory()
-        self.src = os.path.join(self.tmp.name, "foo.txt")
-        with open(self.src, "w", encoding="utf-8") as handle:
-            handle.write("hello")
         self.client = FileClient()
 
-    def tearDown(self):
-        self.tmp.cleanup()
-
     def test_compress_and_decompress(self):
-        zip_path = self.client.compress_file(self.src)
-        self.assertTrue(os.path.isfile(zip_path))
+        archive = self.client.compress_stream(b"hello", "foo.txt")
+        self.assertTrue(archive.startswith(b"PK"))
+
+        files = self.client.decompress_stream(archive)
+
+        self.assertEqual(files, {"foo.txt": b"hello"})
+
+
+class TestDeflateBackends(unittest.TestCase):
+    def setUp(self):
+        self.client = FileClient()
+        self.payload = os.urandom(64 * 1024) + b"a" * 64 * 1024
+        _deflate_backend.cache_clear()
+        self.addCleanup(_deflate_backend.cache_clear)
+
+    def roundtrip(self, codec, backend):
+        with mock.patch.dict(os.environ, {"FILEX_CODEC": codec}):
+            _deflate_backend.cache_clear()
+            self.assertIs(_deflate_backend(), backend)
+            archive = self.client.compress_stream(self.payload, "data.bin")
+            files = self.client.decompress_stream(archive)
+        self.assertEqual(files, {"data.bin": self.payload})
+        # Whatever the backend, the archive is plain deflate.
+        with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+            self.assertEqual(zf.read("data.bin"), self.payload)
+
+    def test_zlib_backend_roundtrip(self):
+        self.roundtrip("zlib", zlib)
 
-        out_dir = os.path.join(self.tmp.name, "out")
-        os.makedirs(out_dir)
-        self.client.decompress_file(zip_path, out_dir)
+    @unittest.skipUnless(isal_zlib, "needs isal")
+    def test_isal_backend_roundtrip(self):
+        self.roundtrip("isal", isal_zlib)
 
-        with open(os.path.join(out_dir, "foo.txt"), encoding="utf-8") as handle:
-            self.assertEqual(handle.read(), "hello")
+    def test_unknown_stream_internals_fall_back_to_stdlib(self):
+        stream = io.BytesIO()
+        with mock.patch.object(
+            client_module, "_deflate_backend", return_value=SimpleNamespace()
+        ), mock.patch.object(zipfile.ZipFile, "open", return_value=stream):
+            with _ZipFile(io.BytesIO(), "w", zipfile.ZIP_DEFLATED) as zf:
+                self.assertIs(zf.open("x", "w"), stream)
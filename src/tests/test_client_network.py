@@ -1,66 +1,153 @@
 import os
-import shutil
 import socket
-import tempfile
-import threading
-import time
 import unittest
+from unittest import mock
 
+import client as client_module
 from client import FileClient
-from server import FileServer
-from shared import FileNotFound
+from shared import ErrorDuringUpload, FileNotFound
+
+try:
+    from ._net import HOST, clear_storage, fast_tmpdir, shared_server, start_server
+except ImportError:  # pragma: no cover - run via `unittest discover tests`
+    from _net import (  # type: ignore
+        HOST,
+        clear_storage,
+        fast_tmpdir,
+        shared_server,
+        start_server,
+    )
+
+try:
+    import pgzip
+except ImportError:  # pragma: no cover - optional dependency
+    pgzip = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
 
 
 class TestClientUploadDownload(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        sock = socket.socket()
-        sock.bind(("127.0.0.1", 0))
-        cls.port = sock.getsockname()[1]
-        sock.close()
-
-        cls.storage = tempfile.TemporaryDirectory()
-        server = FileServer(
-            host="127.0.0.1",
-            port=cls.port,
-            storage_dir=cls.storage.name,
-            mode="threaded",
-        )
-        cls.thread = threading.Thread(target=server.start, daemon=True)
-        cls.thread.start()
-        time.sleep(0.1)
+        cls.host, cls.port, cls.storage_dir = shared_server()
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.storage.cleanup()
+    def setUp(self):
+        clear_storage(self.storage_dir)
+        self.tmp_local = fast_tmpdir()
+        self.addCleanup(self.tmp_local.cleanup)
+        self.tmp_dl = fast_tmpdir()
+        self.addCleanup(self.tmp_dl.cleanup)
 
     def test_roundtrip_upload_download(self):
-        local = os.path.join(tempfile.gettempdir(), "up.txt")
+        local = os.path.join(self.tmp_local.name, "up.txt")
         with open(local, "w", encoding="utf-8") as handle:
             handle.write("data123")
 
-        client = FileClient(host="127.0.0.1", port=self.port)
+        client = FileClient(host=self.host, port=self.port, keepalive=True)
         client.connect()
-        client.upload(local, compress=False)
-        client.disconnect()
+        self.addCleanup(client.disconnect)
 
-        stored = os.path.join(self.storage.name, "up.txt")
+        client.upload(local, compress=False)
+        stored = os.path.join(self.storage_dir, "up.txt")
         self.assertTrue(os.path.isfile(stored))
 
-        outdir = os.path.join(tempfile.gettempdir(), "dlout")
-        if os.path.isdir(outdir):
-            shutil.rmtree(outdir)
-        os.makedirs(outdir)
+        client.download("up.txt", decompress=False, output_dir=self.tmp_dl.name)
+        with open(os.path.join(self.tmp_dl.name, "up.txt"), encoding="utf-8") as handle:
+            self.assertEqual(handle.read(), "data123")
+
+    def test_raw_upload_containing_end_marker(self):
+        payload = b"head\n<END>\nLOAD evil.txt\ntail"
+        local = os.path.join(self.tmp_local.name, "marker.bin")
+        with open(local, "wb") as handle:
+            handle.write(payload)
+        other = os.path.join(self.tmp_local.name, "next.txt")
+        with open(other, "wb") as handle:
+            handle.write(b"next")
 
+        client = FileClient(host=self.host, port=self.port, keepalive=True)
         client.connect()
-        client.download("up.txt", decompress=False, output_dir=outdir)
-        client.disconnect()
+        self.addCleanup(client.disconnect)
+        client.upload(local)
+        client.upload(other)
 
-        with open(os.path.join(outdir, "up.txt"), encoding="utf-8") as handle:
-            self.assertEqual(handle.read(), "data123")
+        self.assertEqual(
+            sorted(os.listdir(self.storage_dir)), ["marker.bin", "next.txt"]
+        )
+        with open(os.path.join(self.storage_dir, "marker.bin"), "rb") as handle:
+            self.assertEqual(handle.read(), payload)
+
+    def test_large_listing_leaves_connection_usable(self):
+        for i in range(1000):
+            open(os.path.join(self.storage_dir, f"file_{i:05d}.dat"), "wb").close()
+        with open(os.path.join(self.storage_dir, "after.txt"), "wb") as handle:
+            handle.write(b"after")
+
+        client = FileClient(host=self.host, port=self.port, keepalive=True)
+        client.connect()
+        self.addCleanup(client.disconnect)
+        with self.assertLogs(level="INFO") as logs:
+            client.list_files()
+        self.assertIn("file_00999.dat", "\n".join(logs.output))
+
+        client.download("after.txt", output_dir=self.tmp_dl.name)
+        with open(os.path.join(self.tmp_dl.name, "after.txt"), "rb") as handle:
+            self.assertEqual(handle.read(), b"after")
+
+    @unittest.skipUnless(hasattr(socket, "TCP_KEEPIDLE"), "needs TCP_KEEPIDLE")
+    def test_keepalive_sets_probe_timers(self):
+        client = FileClient(host=self.host, port=self.port, keepalive=True)
+        client.connect()
+        self.addCleanup(client.disconnect)
+        sock = client.client_socket
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        for option, value in (
+            (socket.TCP_KEEPIDLE, client_module.KEEPALIVE_IDLE),
+            (socket.TCP_KEEPINTVL, client_module.KEEPALIVE_INTERVAL),
+            (socket.TCP_KEEPCNT, client_module.KEEPALIVE_PROBES),
+        ):
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, option), value)
+
+    def test_empty_file_roundtrip(self):
+        open(os.path.join(self.storage_dir, "empty.txt"), "wb").close()
+        with open(os.path.join(self.storage_dir, "b.txt"), "wb") as handle:
+            handle.write(b"b")
+
+        client = FileClient(host=self.host, port=self.port, keepalive=True)
+        client.connect()
+        self.addCleanup(client.disconnect)
+        client.download("empty.txt", output_dir=self.tmp_dl.name)
+        client.download("b.txt", output_dir=self.tmp_dl.name)
+
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.tmp_dl.name, "empty.txt")), 0
+        )
+        with open(os.path.join(self.tmp_dl.name, "b.txt"), "rb") as handle:
+            self.assertEqual(handle.read(), b"b")
+
+    def test_download_reports_size_and_progress(self):
+        payload = os.urandom(300_000)
+        with open(os.path.join(self.storage_dir, "sized.bin"), "wb") as handle:
+            handle.write(payload)
 
-        os.remove(local)
-        shutil.rmtree(outdir)
+        sizes = []
+        chunks = []
+        client = FileClient(host=self.host, port=self.port)
+        client.connect()
+        client.download(
+            "sized.bin",
+            output_dir=self.tmp_dl.name,
+            progress_cb=chunks.append,
+            on_size=sizes.append,
+        )
+        client.disconnect()
+        with open(os.path.join(self.tmp_dl.name, "sized.bin"), "rb") as handle:
+            self.assertEqual(handle.read(), payload)
+
+        self.assertEqual(sizes, [len(payload)])
+        self.assertEqual(sum(chunks), len(payload))
 
     def test_upload_nonexistent_raises(self):
         client = FileClient()
@@ -68,3 +155,105 @@ class TestClientUploadDownload(unittest.TestCase):
         with self.assertRaises(FileNotFound):
             client.upload("no_such_file.txt")
         client.disconnect()
+
+    def test_share_compressed_directory(self):
+        for i in range(40):
+            with open(os.path.join(self.tmp_local.name, f"f{i}.txt"), "wb") as handle:
+                handle.write(b"payload %d" % i)
+
+        FileClient(host=self.host, port=self.port).share_directory(
+            self.tmp_local.name, compress=True
+        )
+        self.assertEqual(
+            sorted(os.listdir(self.storage_dir)),
+            sorted(f"f{i}.txt.zip" for i in range(40)),
+        )
+
+    def test_idle_connection_frees_its_worker(self):
+        port, _ = start_server(self.tmp_dl.name, max_workers=1, idle_timeout=0.2)
+        idle = socket.create_connection((HOST, port))
+        self.addCleanup(idle.close)
+        with open(os.path.join(self.tmp_local.name, "a.txt"), "wb") as handle:
+            handle.write(b"a")
+
+        client = FileClient(host=HOST, port=port, timeout=5)
+        client.connect()
+        self.addCleanup(client.disconnect)
+        client.upload(os.path.join(self.tmp_local.name, "a.txt"))
+        self.assertEqual(os.listdir(self.tmp_dl.name), ["a.txt"])
+        self.assertEqual(idle.recv(16), b"")
+
+    def test_share_fails_when_server_pool_is_full(self):
+        port, _ = start_server(self.tmp_dl.name, max_workers=1)
+        # Holds the server's only worker thread until it idles out (60 s).
+        blocker = socket.create_connection((HOST, port))
+        self.addCleanup(blocker.close)
+        with open(os.path.join(self.tmp_local.name, "a.txt"), "wb") as handle:
+            handle.write(b"a")
+
+        client = FileClient(host=HOST, port=port, timeout=0.2)
+        with self.assertRaises(ErrorDuringUpload):
+            client.share_directory(self.tmp_local.name, compress=True)
+
+
+class TestCompressedRoundTrips(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.host, cls.port, cls.storage_dir = shared_server()
+
+    def setUp(self):
+        clear_storage(self.storage_dir)
+        self.tmp_local = fast_tmpdir()
+        self.addCleanup(self.tmp_local.cleanup)
+        self.tmp_dl = fast_tmpdir()
+        self.addCleanup(self.tmp_dl.cleanup)
+        # Incompressible data is copied into the compressed stream verbatim,
+        # so the old end marker shows up there too.
+        self.payload = os.urandom(100_000) + b"<END>\n" + os.urandom(100_000)
+        self.local = os.path.join(self.tmp_local.name, "data.bin")
+        with open(self.local, "wb") as handle:
+            handle.write(self.payload)
+
+    def connect(self, port=None):
+        client = FileClient(host=self.host, port=port or self.port)
+        client.connect()
+        self.addCleanup(client.disconnect)
+        return client
+
+    def assert_downloaded(self, client, name):
+        client.download(name, decompress=True, output_dir=self.tmp_dl.name)
+        self.assertEqual(os.listdir(self.tmp_dl.name), ["data.bin"])
+        with open(os.path.join(self.tmp_dl.name, "data.bin"), "rb") as handle:
+            self.assertEqual(handle.read(), self.payload)
+
+    def test_deflate_upload_roundtrip(self):
+        client = self.connect()
+        with mock.patch.object(client_module, "pgzip", None):
+            client.upload(self.local, compress=True)
+        self.assertEqual(os.listdir(self.storage_dir), ["data.bin.zip"])
+        self.assert_downloaded(client, "data.bin.zip")
+
+    @unittest.skipUnless(pgzip, "needs pgzip")
+    def test_parallel_gzip_upload_roundtrip(self):
+        client = self.connect()
+        with mock.patch.object(client_module, "PARALLEL_GZIP_MIN", 0):
+            client.upload(self.local, compress=True)
+        self.assertEqual(os.listdir(self.storage_dir), ["data.bin.gz"])
+        self.assert_downloaded(client, "data.bin.gz")
+
+    @unittest.skipUnless(zstandard, "needs zstandard")
+    def test_zstd_upload_is_decoded_on_receipt(self):
+        client = self.connect()
+        client.upload(self.local, compress=True, codec="zstd")
+        with open(os.path.join(self.storage_dir, "data.bin"), "rb") as handle:
+            self.assertEqual(handle.read(), self.payload)
+
+    @unittest.skipUnless(zstandard, "needs zstandard")
+    def test_zstd_stored_compressed_roundtrip(self):
+        storage = fast_tmpdir()
+        self.addCleanup(storage.cleanup)
+        port, _ = start_server(storage.name, store_compressed=True)
+        client = self.connect(port)
+        client.upload(self.local, compress=True, codec="zstd")
+        self.assertEqual(os.listdir(storage.name), ["data.bin.zst"])
+        self.assert_downloaded(client, "data.bin.zst")
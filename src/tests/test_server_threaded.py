@@ -1,56 +1,250 @@
 import os
 import socket
-import tempfile
-import threading
+import struct
 import time
 import unittest
+from unittest import mock
 
+import server as server_module
 from server import FileServer
 
+try:
+    from ._net import (
+        HOST,
+        clear_storage,
+        fast_tmpdir,
+        free_port,
+        shared_server,
+        shared_unix_server,
+    )
+except ImportError:  # pragma: no cover - run via `unittest discover tests`
+    from _net import (  # type: ignore
+        HOST,
+        clear_storage,
+        fast_tmpdir,
+        free_port,
+        shared_server,
+        shared_unix_server,
+    )
 
+
+def _touch(path: str, data: bytes = b"x") -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if data:
+            os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs Unix domain sockets")
 class TestServerThreaded(unittest.TestCase):
+    mode = "threaded"
+    use_uvloop = True
+
     @classmethod
     def setUpClass(cls):
-        sock = socket.socket()
-        sock.bind(("127.0.0.1", 0))
-        cls.port = sock.getsockname()[1]
-        sock.close()
-
-        cls.storage = tempfile.TemporaryDirectory()
-        server = FileServer(
-            host="127.0.0.1",
-            port=cls.port,
-            storage_dir=cls.storage.name,
-            mode="threaded",
-        )
-        cls.thread = threading.Thread(target=server.start, daemon=True)
-        cls.thread.start()
-        time.sleep(0.1)
+        cls.sock_path, cls.storage_dir = shared_unix_server(cls.mode, cls.use_uvloop)
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.storage.cleanup()
+    def setUp(self):
+        clear_storage(self.storage_dir)
+        self.buf = bytearray(64 * 1024)
+
+    def connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.sock_path)
+        return sock
 
     def send_recv(self, message: str) -> str:
-        with socket.create_connection(("127.0.0.1", self.port)) as sock:
-            sock.sendall((message + "\n").encode())
-            return sock.recv(4096).decode()
+        with self.connect() as sock:
+            return self.exchange(sock, message)
+
+    def exchange(self, sock: socket.socket, message: str) -> str:
+        # GET FILES replies end with a blank line, so read up to it and keep
+        # the connection open rather than half-closing it.
+        response = bytearray()
+        view = memoryview(self.buf)
+        sock.sendall((message + "\n").encode())
+        while response != b"\n" and not response.endswith(b"\n\n"):
+            n = sock.recv_into(view)
+            if not n:
+                break
+            response += view[:n]
+        if sock.family != socket.AF_UNIX:
+            # The server is still waiting for the next command, so this end
+            # closes first; a zero linger turns that close into a reset and
+            # leaves no TIME_WAIT entry behind for repeated runs.
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+        return response.decode()
+
+    def test_list_over_tcp(self):
+        host, port, _ = shared_server(self.mode, self.use_uvloop)
+        _touch(os.path.join(self.storage_dir, "tcp.txt"))
+        with socket.create_connection((host, port)) as sock:
+            self.assertEqual(self.exchange(sock, "GET FILES ALL"), "tcp.txt\n\n")
 
     def test_list_empty(self):
         response = self.send_recv("GET FILES ALL")
-        self.assertEqual(response.strip(), "")
+        self.assertEqual(response, "\n")
 
     def test_store_and_list(self):
-        path = os.path.join(self.storage.name, "a.txt")
-        with open(path, "w", encoding="utf-8") as handle:
-            handle.write("x")
+        _touch(os.path.join(self.storage_dir, "a.txt"))
         response = self.send_recv("GET FILES ALL")
         self.assertIn("a.txt", response)
 
+    def test_list_larger_than_one_read(self):
+        names = {f"file_{i:05d}.dat" for i in range(1000)}
+        for name in names:
+            _touch(os.path.join(self.storage_dir, name), b"")
+        response = self.send_recv("GET FILES ALL")
+        self.assertEqual(response.split("\n"), sorted(names) + ["", ""])
+
+    def test_cached_listing_sees_upload_in_same_mtime_tick(self):
+        with mock.patch.object(server_module, "LISTING_CACHE_MIN", 0):
+            self.assertEqual(self.send_recv("GET FILES ALL"), "\n")
+            mtime = os.stat(self.storage_dir).st_mtime_ns
+            with self.connect() as sock:
+                sock.sendall(b"BATCH LOAD 1\nnew.txt\t1\n")
+                self.assertEqual(sock.recv(16), b"READY\n")
+                sock.sendall(b"x")
+                self.assertEqual(sock.recv(16), b"OK\n")
+            # As if the upload landed within the cached listing's clock tick.
+            os.utime(self.storage_dir, ns=(mtime, mtime))
+            self.assertEqual(self.send_recv("GET FILES ALL"), "new.txt\n\n")
+
+    def get_file(self, reader, sock: socket.socket, name: str) -> bytes:
+        sock.sendall(f"GET FILE {name}\n".encode())
+        header = reader.readline().split()
+        self.assertEqual(header[0], b"READY")
+        return reader.read(int(header[1]))
+
+    def assert_get_files(self, files) -> None:
+        for name, data in files.items():
+            _touch(os.path.join(self.storage_dir, name), data)
+        with self.connect() as sock, sock.makefile("rb") as reader:
+            for name, data in files.items():
+                self.assertEqual(self.get_file(reader, sock, name), data)
+            # Still in step with the server after the downloads.
+            sock.sendall(b"GET FILES missing\n")
+            self.assertEqual(reader.readline(), b"\n")
+
+    def test_get_file(self):
+        self.assert_get_files({"big.bin": os.urandom(3 * 1024 * 1024 + 1)})
+
+    def test_get_empty_file(self):
+        self.assert_get_files({"empty.txt": b"", "after.txt": b"after"})
+
     def test_search_pattern(self):
+        # Listings only read directory entries, so empty files will do.
         for name in ("one.log", "two.txt", "three.log"):
-            with open(os.path.join(self.storage.name, name), "w", encoding="utf-8") as handle:
-                handle.write("x")
+            _touch(os.path.join(self.storage_dir, name), b"")
         response = self.send_recv("GET FILES *.log")
         lines = response.strip().splitlines()
         self.assertEqual(set(lines), {"one.log", "three.log"})
+
+    def test_load_chunks_split_across_reads(self):
+        with self.connect() as sock:
+            sock.sendall(b"LOAD split.txt\n")
+            self.assertEqual(sock.recv(16), b"READY\n")
+            # Headers and payloads split mid-way, and a payload that holds
+            # what used to be the end marker.
+            for part in (b"1", b"0\nda<END>\n", b"ta", b"0", b"\n"):
+                sock.sendall(part)
+                time.sleep(0.02)
+            self.assertEqual(sock.recv(16), b"OK\n")
+        with open(os.path.join(self.storage_dir, "split.txt"), "rb") as handle:
+            self.assertEqual(handle.read(), b"da<END>\nta")
+
+    def test_load_bad_chunk_header_closes_connection(self):
+        with self.connect() as sock:
+            sock.sendall(b"LOAD bad.txt\nxyz\nGET FILES ALL\n")
+            response = b""
+            while True:
+                data = sock.recv(256)
+                if not data:
+                    break
+                response += data
+        # READY and at most an error line; the trailing command is never
+        # answered.
+        self.assertTrue(response.startswith(b"READY\n"))
+        self.assertNotIn(b"\n\n", response)
+
+    def test_load_batch_manifest(self):
+        with self.connect() as sock:
+            sock.sendall(b"BATCH LOAD 3\nb1.txt\t5\nb2.txt\t0\nb3.txt\t3\n")
+            self.assertEqual(sock.recv(16), b"READY\n")
+            sock.sendall(b"hello")
+            time.sleep(0.05)
+            sock.sendall(b"abc")
+            self.assertEqual(sock.recv(16), b"OK\n")
+        for name, data in (("b1.txt", b"hello"), ("b2.txt", b""), ("b3.txt", b"abc")):
+            with open(os.path.join(self.storage_dir, name), "rb") as handle:
+                self.assertEqual(handle.read(), data)
+
+    def assert_upload_fails_in_step(self, command: bytes, payload: bytes) -> None:
+        # "sub" is a directory, so the file can't be opened; the payload must
+        # still be consumed rather than run as commands.
+        os.mkdir(os.path.join(self.storage_dir, "sub"))
+        with self.connect() as sock, sock.makefile("rb") as reader:
+            sock.sendall(command)
+            self.assertEqual(reader.readline(), b"READY\n")
+            sock.sendall(payload)
+            self.assertTrue(reader.readline().startswith(b"ERROR ErrorDuringUpload"))
+            sock.sendall(b"GET FILES ALL\n")
+            self.assertEqual(reader.readline(), b"sub\n")
+            self.assertEqual(reader.readline(), b"\n")
+        self.assertEqual(os.listdir(self.storage_dir), ["sub"])
+
+    def test_load_batch_write_failure_consumes_payload(self):
+        self.assert_upload_fails_in_step(
+            b"BATCH LOAD 2\nsub\t29\nb.txt\t2\n",
+            b"LOAD injected.txt\nowned<END>\n" + b"ok",
+        )
+
+    def test_load_write_failure_consumes_payload(self):
+        self.assert_upload_fails_in_step(
+            b"LOAD sub\n", b"18\nLOAD injected.txt\n5\nowned0\n"
+        )
+
+    def test_load_batch_rejects_negative_size(self):
+        with self.connect() as sock:
+            sock.sendall(b"BATCH LOAD 2\nok.txt\t2\nneg.txt\t-5\n")
+            self.assertTrue(sock.recv(256).startswith(b"ERROR ErrorDuringUpload"))
+            # The connection is still in step: nothing was taken as a command.
+            self.assertEqual(self.exchange(sock, "GET FILES ALL"), "\n")
+
+
+class TestServerAsync(TestServerThreaded):
+    # The same protocol tests against the asyncio implementation.
+    mode = "async"
+
+
+@unittest.skipUnless(server_module.uvloop, "uvloop not installed")
+class TestServerAsyncStdlib(TestServerAsync):
+    # With uvloop installed TestServerAsync runs on it, which leaves the
+    # stdlib loop's native sendfile path untested.
+    use_uvloop = False
+
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT"), "needs SO_REUSEPORT")
+class TestBindTcp(unittest.TestCase):
+    def bind_twice(self, workers: int) -> None:
+        port = free_port()
+        storage = fast_tmpdir()
+        self.addCleanup(storage.cleanup)
+        for _ in range(2):
+            server = FileServer(
+                host=HOST, port=port, storage_dir=storage.name, workers=workers
+            )
+            sock = server._bind_tcp()
+            self.addCleanup(sock.close)
+            sock.listen()
+
+    def test_single_worker_keeps_port_to_itself(self):
+        with self.assertRaises(OSError):
+            self.bind_twice(workers=1)
+
+    def test_workers_share_port(self):
+        self.bind_twice(workers=2)
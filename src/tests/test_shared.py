@@ -13,13 +13,16 @@ class TestSharedErrors(unittest.TestCase):
         error = FileNotFound("missing.txt")
         self.assertIn("missing.txt", str(error))
 
-    def test_error_types_are_exceptions(self):
-        for exc_cls, msg in [
-            (ErrorDuringUpload, "upload fail"),
-            (ErrorDuringDownload, "download fail"),
-            (PeerDisconnected, "peer gone"),
-        ]:
-            with self.subTest(exc=exc_cls):
-                error = exc_cls(msg)
-                self.assertIsInstance(error, Exception)
-                self.assertIn(msg, str(error))
+    def assert_error_type(self, exc_cls: type, msg: str) -> None:
+        error = exc_cls(msg)
+        self.assertIsInstance(error, Exception)
+        self.assertIn(msg, str(error))
+
+    def test_error_during_upload_is_exception(self):
+        self.assert_error_type(ErrorDuringUpload, "upload fail")
+
+    def test_error_during_download_is_exception(self):
+        self.assert_error_type(ErrorDuringDownload, "download fail")
+
+    def test_peer_disconnected_is_exception(self):
+        self.assert_error_type(PeerDisconnected, "peer gone")